@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+AWS客户端
+进程内共享的boto3会话和客户端，复用凭证链和HTTP连接池
+"""
+
+import boto3
+from botocore.config import Config
+
+# 所有客户端共享的连接池和重试配置
+AWS_CONFIG = Config(
+    max_pool_connections=64,
+    tcp_keepalive=True,
+    retries={'max_attempts': 5, 'mode': 'adaptive'}
+)
+
+# 凭证链只在会话创建时解析一次，由所有客户端共享
+_SESSION = boto3.session.Session()
+
+S3 = _SESSION.client('s3', config=AWS_CONFIG)
+DDB = _SESSION.resource('dynamodb', config=AWS_CONFIG)
+SQS = _SESSION.client('sqs', config=AWS_CONFIG)
+
+
+def create_probe_client(service_name: str, timeout: float):
+    """
+    创建健康探测专用客户端：短连接/读取超时且不重试，
+    AWS变慢时探测快速失败，不会长时间占用探测线程
+    
+    Args:
+        service_name: AWS服务名
+        timeout: 连接和读取超时(秒)
+        
+    Returns:
+        boto3客户端
+    """
+    return _SESSION.client(service_name, config=Config(
+        connect_timeout=timeout,
+        read_timeout=timeout,
+        max_pool_connections=4,
+        tcp_keepalive=True,
+        retries={'max_attempts': 1, 'mode': 'standard'}
+    ))
+
+
+def get_credentials():
+    """获取共享会话缓存的AWS凭证"""
+    return _SESSION.get_credentials()
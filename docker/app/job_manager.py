@@ -6,16 +6,39 @@ DynamoDB任务管理器
 
 import os
 import time
-from typing import Dict, Any, Optional, List
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, List, Callable, Tuple
 from decimal import Decimal
 from datetime import datetime, timezone, timedelta
+from functools import lru_cache
 
-import boto3
 import structlog
+from boto3.dynamodb.conditions import Key
 from botocore.exceptions import ClientError
 
+from aws_clients import DDB
+
 logger = structlog.get_logger()
 
+# 任务状态-创建时间 GSI (见 02-ecs-data-services.yaml)
+_STATUS_CREATED_INDEX = 'status-created-index'
+_JOB_STATUSES = ('QUEUED', 'pending', 'processing', 'completed', 'failed', 'interrupted')
+
+# BatchWriteItem 单次请求上限及UnprocessedItems重试次数
+_BATCH_WRITE_SIZE = 25
+_BATCH_WRITE_MAX_ATTEMPTS = 5
+
+# 北京时间 (UTC+8) 及输出格式
+_BEIJING_TZ = timezone(timedelta(hours=8))
+_BEIJING_FMT = "%Y-%m-%d %H:%M:%S BJT"
+
+# 以时间戳传入时需转换为北京时间字符串的字段
+_TIMESTAMP_FIELDS = frozenset({'started_at', 'completed_at', 'received_at', 'failed_at'})
+
+# 仅更新状态时的更新表达式
+_STATUS_ONLY_EXPR = "SET #status = :status, updated_at = :updated_at"
+
 def timestamp_to_beijing_str(timestamp):
     """
     将时间戳转换为北京时间字符串格式 (BJT)
@@ -29,41 +52,82 @@ def timestamp_to_beijing_str(timestamp):
     if isinstance(timestamp, Decimal):
         timestamp = float(timestamp)
     
-    # 创建UTC时间
-    dt_utc = datetime.fromtimestamp(timestamp, tz=timezone.utc)
-    
-    # 转换为北京时间 (UTC+8)
-    beijing_tz = timezone(timedelta(hours=8))
-    dt_beijing = dt_utc.astimezone(beijing_tz)
+    return datetime.fromtimestamp(timestamp, tz=_BEIJING_TZ).strftime(_BEIJING_FMT)
+
+@lru_cache(maxsize=64)
+def _build_update_template(keys: Tuple[str, ...]) -> Tuple[str, Dict[str, str]]:
+    """
+    按字段名组合构建并缓存更新表达式和属性名映射
     
-    # 格式化为指定格式
-    return dt_beijing.strftime("%Y-%m-%d %H:%M:%S BJT")
+    Args:
+        keys: 除status外要更新的字段名
+        
+    Returns:
+        (更新表达式, 属性名映射)，调用方不应修改返回的映射
+    """
+    update_parts = [_STATUS_ONLY_EXPR]
+    expression_attribute_names = {'#status': 'status'}
+    for key in keys:
+        update_parts.append(f"#{key} = :{key}")
+        expression_attribute_names[f"#{key}"] = key
+    return ", ".join(update_parts), expression_attribute_names
+
+def _contains_float(obj) -> bool:
+    """迭代检查嵌套的dict/list中是否包含float"""
+    stack = [obj]
+    while stack:
+        value = stack.pop()
+        value_type = type(value)
+        if value_type is float:
+            return True
+        if value_type is dict:
+            stack.extend(value.values())
+        elif value_type is list:
+            stack.extend(value)
+    return False
 
 class DynamoDBJobManager:
     """DynamoDB任务管理器"""
     
     def _convert_floats_to_decimal(self, obj):
         """
-        递归地将对象中的float类型转换为Decimal类型
+        将对象中的float类型转换为Decimal类型
         DynamoDB不支持原生的float类型
         
+        使用显式栈迭代遍历，不受递归深度限制；不含float时直接返回原对象，
+        否则返回转换后的副本，不修改调用方传入的数据
+        
         Args:
             obj: 要转换的对象
             
         Returns:
             转换后的对象
         """
-        if isinstance(obj, float):
+        obj_type = type(obj)
+        if obj_type is float:
             return Decimal(str(obj))
-        elif isinstance(obj, dict):
-            return {key: self._convert_floats_to_decimal(value) for key, value in obj.items()}
-        elif isinstance(obj, list):
-            return [self._convert_floats_to_decimal(item) for item in obj]
-        else:
+        if (obj_type is not dict and obj_type is not list) or not _contains_float(obj):
             return obj
+        
+        root = dict(obj) if obj_type is dict else list(obj)
+        stack = [root]
+        while stack:
+            container = stack.pop()
+            items = container.items() if type(container) is dict else enumerate(container)
+            for key, value in list(items):
+                value_type = type(value)
+                if value_type is float:
+                    container[key] = Decimal(str(value))
+                elif value_type is dict:
+                    container[key] = copy = dict(value)
+                    stack.append(copy)
+                elif value_type is list:
+                    container[key] = copy = list(value)
+                    stack.append(copy)
+        return root
     
     def __init__(self):
-        self.dynamodb = boto3.resource('dynamodb')
+        self.dynamodb = DDB
         self.table_name = os.getenv('DYNAMODB_TABLE')
         
         if not self.table_name:
@@ -71,6 +135,9 @@ class DynamoDBJobManager:
         
         self.table = self.dynamodb.Table(self.table_name)
         
+        # DynamoDB调用出错时的回调 (用于使健康检查缓存失效)
+        self.on_client_error: Optional[Callable[[], None]] = None
+        
         logger.info("DynamoDB任务管理器初始化", table_name=self.table_name)
     
     def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
@@ -96,6 +163,7 @@ class DynamoDBJobManager:
                 
         except ClientError as e:
             logger.error("获取任务失败", job_id=job_id, error=str(e))
+            self._notify_client_error()
             raise
     
     def update_job_status(self, job_id: str, status: str, **kwargs) -> bool:
@@ -111,9 +179,9 @@ class DynamoDBJobManager:
             更新是否成功
         """
         try:
-            # 构建更新表达式
-            update_expression = "SET #status = :status, updated_at = :updated_at"
-            expression_attribute_names = {'#status': 'status'}
+            # 更新表达式结构只取决于字段名组合，复用缓存的模板
+            fields = {key: value for key, value in kwargs.items() if value is not None}
+            update_expression, expression_attribute_names = _build_update_template(tuple(fields))
             
             # 当前时间戳转换为北京时间字符串
             current_time = time.time()
@@ -122,28 +190,22 @@ class DynamoDBJobManager:
                 ':updated_at': timestamp_to_beijing_str(current_time)
             }
             
-            # 添加其他字段
-            for key, value in kwargs.items():
-                if value is not None:
-                    attr_name = f"#{key}"
-                    attr_value = f":{key}"
-                    
-                    update_expression += f", {attr_name} = {attr_value}"
-                    expression_attribute_names[attr_name] = key
-                    
-                    # 处理不同类型的值
-                    if isinstance(value, (int, float, Decimal)) and key in ['started_at', 'completed_at', 'received_at', 'failed_at']:
-                        # 将时间戳转换为北京时间字符串
-                        expression_attribute_values[attr_value] = timestamp_to_beijing_str(value)
-                    else:
-                        # 使用递归函数转换所有float类型为Decimal类型
-                        expression_attribute_values[attr_value] = self._convert_floats_to_decimal(value)
-            
-            # 执行更新
-            response = self.table.update_item(
+            # 添加其他字段的值
+            for key, value in fields.items():
+                # 处理不同类型的值
+                if key in _TIMESTAMP_FIELDS and isinstance(value, (int, float, Decimal)):
+                    # 将时间戳转换为北京时间字符串
+                    expression_attribute_values[f":{key}"] = timestamp_to_beijing_str(value)
+                else:
+                    # 转换所有float类型为Decimal类型
+                    expression_attribute_values[f":{key}"] = self._convert_floats_to_decimal(value)
+            
+            # 执行更新 (资源对象非线程安全，多个任务线程并发更新时使用底层客户端)
+            response = self.dynamodb.meta.client.update_item(
+                TableName=self.table_name,
                 Key={'job_id': job_id},
                 UpdateExpression=update_expression,
-                ExpressionAttributeNames=expression_attribute_names,
+                ExpressionAttributeNames=dict(expression_attribute_names),
                 ExpressionAttributeValues=expression_attribute_values,
                 ReturnValues='UPDATED_NEW'
             )
@@ -159,8 +221,17 @@ class DynamoDBJobManager:
                         job_id=job_id, 
                         status=status,
                         error=str(e))
+            self._notify_client_error()
             return False
     
+    def _notify_client_error(self):
+        """通知DynamoDB调用出错"""
+        if self.on_client_error is not None:
+            try:
+                self.on_client_error()
+            except Exception as e:
+                logger.warning("DynamoDB错误回调执行失败", error=str(e))
+    
     def query_jobs_by_status(self, status: str, limit: int = 10) -> List[Dict[str, Any]]:
         """
         根据状态查询任务
@@ -228,12 +299,14 @@ class DynamoDBJobManager:
             新的重试次数
         """
         try:
-            response = self.table.update_item(
+            # 资源对象非线程安全，使用底层客户端
+            response = self.dynamodb.meta.client.update_item(
+                TableName=self.table_name,
                 Key={'job_id': job_id},
-                UpdateExpression='ADD retry_count :inc SET updated_at = :updated_at',
+                UpdateExpression='SET updated_at = :updated_at ADD retry_count :inc',
                 ExpressionAttributeValues={
                     ':inc': 1,
-                    ':updated_at': Decimal(str(time.time()))
+                    ':updated_at': timestamp_to_beijing_str(time.time())
                 },
                 ReturnValues='UPDATED_NEW'
             )
@@ -246,47 +319,30 @@ class DynamoDBJobManager:
             logger.error("增加重试次数失败", job_id=job_id, error=str(e))
             return 0
     
-    def get_job_statistics(self) -> Dict[str, int]:
+    def get_job_statistics(self, total_segments: int = 4) -> Dict[str, int]:
         """
         获取任务统计信息
         
+        Args:
+            total_segments: 并行扫描的分段数
+            
         Returns:
             统计信息字典
         """
         try:
-            stats = {
-                'pending': 0,
-                'processing': 0,
-                'completed': 0,
-                'failed': 0,
-                'total': 0
-            }
+            # 按分段并行扫描表获取统计信息 (注意：大表慎用)
+            status_counts = Counter()
+            with ThreadPoolExecutor(max_workers=total_segments) as executor:
+                futures = [
+                    executor.submit(self._scan_status_segment, segment, total_segments)
+                    for segment in range(total_segments)
+                ]
+                for future in futures:
+                    status_counts.update(future.result())
             
-            # 扫描表获取统计信息 (注意：大表慎用)
-            response = self.table.scan(
-                ProjectionExpression='#status',
-                ExpressionAttributeNames={'#status': 'status'}
-            )
-            
-            for item in response.get('Items', []):
-                status = item.get('status', 'unknown')
-                if status in stats:
-                    stats[status] += 1
-                stats['total'] += 1
-            
-            # 处理分页
-            while 'LastEvaluatedKey' in response:
-                response = self.table.scan(
-                    ProjectionExpression='#status',
-                    ExpressionAttributeNames={'#status': 'status'},
-                    ExclusiveStartKey=response['LastEvaluatedKey']
-                )
-                
-                for item in response.get('Items', []):
-                    status = item.get('status', 'unknown')
-                    if status in stats:
-                        stats[status] += 1
-                    stats['total'] += 1
+            stats = {status: status_counts.get(status, 0)
+                     for status in ('pending', 'processing', 'completed', 'failed')}
+            stats['total'] = sum(status_counts.values())
             
             logger.info("获取任务统计成功", stats=stats)
             return stats
@@ -295,48 +351,64 @@ class DynamoDBJobManager:
             logger.error("获取任务统计失败", error=str(e))
             return {}
     
-    def cleanup_old_jobs(self, days: int = 30) -> int:
+    def _scan_status_segment(self, segment: int, total_segments: int) -> Counter:
+        """
+        扫描单个分段并统计各状态的任务数
+        
+        Args:
+            segment: 分段编号
+            total_segments: 分段总数
+            
+        Returns:
+            状态计数
+        """
+        # 资源对象非线程安全，并行扫描使用底层客户端
+        client = self.dynamodb.meta.client
+        params = {
+            'TableName': self.table_name,
+            'Segment': segment,
+            'TotalSegments': total_segments,
+            'ProjectionExpression': '#status',
+            'ExpressionAttributeNames': {'#status': 'status'}
+        }
+        
+        counts = Counter()
+        while True:
+            response = client.scan(**params)
+            counts.update(item.get('status', 'unknown') for item in response.get('Items', []))
+            
+            # 处理分页
+            if 'LastEvaluatedKey' not in response:
+                return counts
+            params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    
+    def cleanup_old_jobs(self, days: int = 30, max_workers: int = 4) -> int:
         """
         清理旧任务记录
         
         Args:
             days: 保留天数
+            max_workers: 并行删除的线程数
             
         Returns:
             删除的任务数量
         """
         try:
             cutoff_time = time.time() - (days * 24 * 3600)
-            cutoff_decimal = Decimal(str(cutoff_time))
-            
-            # 扫描旧任务
-            response = self.table.scan(
-                FilterExpression='created_at < :cutoff',
-                ExpressionAttributeValues={':cutoff': cutoff_decimal},
-                ProjectionExpression='job_id'
-            )
+            # created_at 由触发Lambda以UTC ISO字符串写入，按字符串比较
+            cutoff = datetime.fromtimestamp(cutoff_time, tz=timezone.utc).replace(tzinfo=None).isoformat()
             
             deleted_count = 0
             
-            # 批量删除
-            with self.table.batch_writer() as batch:
-                for item in response.get('Items', []):
-                    batch.delete_item(Key={'job_id': item['job_id']})
-                    deleted_count += 1
-            
-            # 处理分页
-            while 'LastEvaluatedKey' in response:
-                response = self.table.scan(
-                    FilterExpression='created_at < :cutoff',
-                    ExpressionAttributeValues={':cutoff': cutoff_decimal},
-                    ProjectionExpression='job_id',
-                    ExclusiveStartKey=response['LastEvaluatedKey']
-                )
-                
-                with self.table.batch_writer() as batch:
-                    for item in response.get('Items', []):
-                        batch.delete_item(Key={'job_id': item['job_id']})
-                        deleted_count += 1
+            # 按状态查询GSI中的旧任务，分批并行删除
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [
+                    executor.submit(self._batch_delete_jobs, keys)
+                    for status in _JOB_STATUSES
+                    for keys in self._query_old_job_keys(status, cutoff)
+                ]
+                for future in futures:
+                    deleted_count += future.result()
             
             logger.info("清理旧任务完成", deleted_count=deleted_count, days=days)
             return deleted_count
@@ -344,3 +416,58 @@ class DynamoDBJobManager:
         except ClientError as e:
             logger.error("清理旧任务失败", error=str(e))
             return 0
+    
+    def _query_old_job_keys(self, status: str, cutoff: str):
+        """
+        查询指定状态下创建时间早于cutoff的任务主键
+        
+        Args:
+            status: 任务状态
+            cutoff: 截止时间 (ISO字符串)
+            
+        Yields:
+            每批最多25个任务主键
+        """
+        params = {
+            'IndexName': _STATUS_CREATED_INDEX,
+            'KeyConditionExpression': Key('status').eq(status) & Key('created_at').lt(cutoff),
+            'ProjectionExpression': 'job_id'
+        }
+        
+        while True:
+            response = self.table.query(**params)
+            keys = [{'job_id': item['job_id']} for item in response.get('Items', [])]
+            for i in range(0, len(keys), _BATCH_WRITE_SIZE):
+                yield keys[i:i + _BATCH_WRITE_SIZE]
+            
+            # 处理分页
+            if 'LastEvaluatedKey' not in response:
+                return
+            params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    
+    def _batch_delete_jobs(self, keys: List[Dict[str, str]]) -> int:
+        """
+        批量删除任务，重试UnprocessedItems
+        
+        Args:
+            keys: 任务主键列表 (最多25个)
+            
+        Returns:
+            实际删除的数量
+        """
+        # 资源对象非线程安全，并行删除使用底层客户端
+        client = self.dynamodb.meta.client
+        request_items = {
+            self.table_name: [{'DeleteRequest': {'Key': key}} for key in keys]
+        }
+        
+        for attempt in range(_BATCH_WRITE_MAX_ATTEMPTS):
+            response = client.batch_write_item(RequestItems=request_items)
+            request_items = response.get('UnprocessedItems') or {}
+            if not request_items:
+                return len(keys)
+            time.sleep(min(0.05 * (2 ** attempt), 1.0))
+        
+        unprocessed = len(request_items.get(self.table_name, []))
+        logger.warning("部分旧任务删除未完成", unprocessed_count=unprocessed)
+        return len(keys) - unprocessed
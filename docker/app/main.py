@@ -7,25 +7,43 @@ MinerU混合架构处理器主程序
 import os
 import sys
 import time
-import json
 import logging
 import signal
 import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeoutError
 from typing import Optional, Dict, Any
-from datetime import datetime, timezone
-from decimal import Decimal
 
-import boto3
+# 必须在导入torch之前配置CUDA缓存分配器：
+# 可扩展段让不同大小PDF交替处理时复用并扩展已有显存段，减少碎片
+os.environ.setdefault('PYTORCH_CUDA_ALLOC_CONF', 'expandable_segments:True')
+
 import structlog
 import torch
 from flask import Flask, jsonify
-from prometheus_client import Counter, Histogram, Gauge, generate_latest
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram,
+    REGISTRY, generate_latest, multiprocess
+)
+from waitress import create_server
 
 from processor import MinerUProcessor
 from queue_manager import SQSQueueManager
 from job_manager import DynamoDBJobManager, timestamp_to_beijing_str
 from health_checker import HealthChecker
 
+# 优先使用orjson序列化日志，未安装时回退到标准库
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _orjson_dumps(obj, default=None, **kwargs) -> str:
+    """structlog日志序列化 (orjson输出bytes，转为str供标准logging输出)"""
+    return orjson.dumps(obj, default=default, option=orjson.OPT_NON_STR_KEYS).decode()
+
 # 首先配置标准logging，确保所有日志都能输出
 logging.basicConfig(
     level=logging.INFO,
@@ -50,7 +68,8 @@ structlog.configure(
         structlog.processors.StackInfoRenderer(),
         structlog.processors.format_exc_info,
         structlog.processors.UnicodeDecoder(),
-        structlog.processors.JSONRenderer()
+        structlog.processors.JSONRenderer(serializer=_orjson_dumps) if orjson
+        else structlog.processors.JSONRenderer()
     ],
     context_class=dict,
     logger_factory=structlog.stdlib.LoggerFactory(),
@@ -66,40 +85,100 @@ PROCESSING_TIME = Histogram('mineru_processing_duration_seconds', 'Job processin
 ACTIVE_JOBS = Gauge('mineru_active_jobs', 'Currently active jobs')
 QUEUE_SIZE = Gauge('mineru_queue_size', 'SQS queue size')
 
+# 多进程部署时 (设置了PROMETHEUS_MULTIPROC_DIR) 从共享的mmap文件汇总指标，
+# 收集器在抓取时读取文件，注册表只需创建一次
+if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+    METRICS_REGISTRY = CollectorRegistry()
+    multiprocess.MultiProcessCollector(METRICS_REGISTRY)
+else:
+    METRICS_REGISTRY = REGISTRY
+
+@dataclass(frozen=True, slots=True)
+class ProcessorConfig:
+    """处理器配置 (进程启动时从环境变量解析一次)"""
+    compute_mode: str
+    single_task_mode: bool
+    job_id: Optional[str]  # Fargate模式下的特定任务ID
+    enable_gpu_setting: str
+    enable_gpu: Optional[bool]  # None表示让 MinerUProcessor 自动检测
+    poll_interval: int
+    max_messages: int  # CPU并行模式单次接收上限 (GPU串行模式固定为1)
+    queue_metrics_interval: float
+    processing_state_delay: float  # 任务运行超过该秒数才写入处理中状态
+    hostname: str
+    
+    @classmethod
+    def from_env(cls) -> 'ProcessorConfig':
+        """从环境变量构建配置"""
+        # GPU设置 - 支持自动检测
+        gpu_env = os.getenv('ENABLE_GPU', 'auto').lower()
+        return cls(
+            compute_mode=os.getenv('COMPUTE_MODE', 'auto'),
+            single_task_mode=os.getenv('SINGLE_TASK_MODE', 'false').lower() == 'true',
+            job_id=os.getenv('JOB_ID'),
+            enable_gpu_setting=gpu_env,
+            enable_gpu=None if gpu_env == 'auto' else gpu_env in ('true', '1', 'yes'),
+            poll_interval=int(os.getenv('POLL_INTERVAL', '5')),
+            # ReceiveMessage只接受1-10，超出范围时每次接收都会失败
+            max_messages=max(1, min(10, int(os.getenv('SQS_MAX_MESSAGES', '10')))),
+            queue_metrics_interval=float(os.getenv('QUEUE_METRICS_INTERVAL', '30')),
+            processing_state_delay=float(os.getenv('PROCESSING_STATE_DELAY', '2')),
+            hostname=os.getenv('HOSTNAME', 'unknown'),
+        )
+
+CONFIG = ProcessorConfig.from_env()
+
 class MinerUHybridProcessor:
     """MinerU混合架构处理器 - 支持GPU/CPU自动检测"""
     
     def __init__(self):
-        self.compute_mode = os.getenv('COMPUTE_MODE', 'auto')
-        self.single_task_mode = os.getenv('SINGLE_TASK_MODE', 'false').lower() == 'true'
-        self.job_id = os.getenv('JOB_ID')  # Fargate模式下的特定任务ID
+        self.cfg = CONFIG
         
-        # GPU设置 - 支持自动检测
-        gpu_env = os.getenv('ENABLE_GPU', 'auto').lower()
-        if gpu_env == 'auto':
-            self.enable_gpu = None  # 让 MinerUProcessor 自动检测
-        else:
-            self.enable_gpu = gpu_env in ['true', '1', 'yes']
+        # CUDA设备信息 (进程生命周期内不变，仅查询一次)
+        self._cuda_available = torch.cuda.is_available()
+        self._cuda_count = torch.cuda.device_count() if self._cuda_available else 0
+        self._cuda_name = torch.cuda.get_device_name(0) if self._cuda_available else None
         
         # 检测实际的设备类型
-        self.device_type = 'gpu' if torch.cuda.is_available() else 'cpu'
+        self.device_type = 'gpu' if self._cuda_available else 'cpu'
+        # 预绑定设备类型，轮询循环中无需重复传入
+        self.log = logger.bind(device_type=self.device_type)
         
         self.running = True
-        self.current_job = None
+        # 终止信号到达时置位，用于立即打断长轮询和各类等待
+        self._stop_event = threading.Event()
+        # 正在处理的任务 (CPU模式下可能并行多个)
+        self._active_jobs: Dict[str, Dict[str, Any]] = {}
+        self._active_jobs_lock = threading.Lock()
+        # 各任务尚未写入的处理中状态 (中断时先关闭，避免延迟写入覆盖中断状态)
+        self._processing_states: Dict[str, Dict[str, Any]] = {}
+        # CPU模式并行处理的任务数 (GPU模式保持串行，避免显存争用)
+        self.cpu_workers = max(1, (os.cpu_count() or 1) // 2)
+        # 后台AWS I/O (SQS消息删除)，与GPU处理和下一次轮询重叠
+        self._io_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='aws-io')
+        # SQS长轮询在独立线程执行，主线程可在收到终止信号时立即返回
+        self._poll_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sqs-poll')
+        # Flask服务器绑定端口后置位，替代固定等待
+        self._flask_ready = threading.Event()
         
         logger.info("处理器初始化",
-                   compute_mode=self.compute_mode,
-                   enable_gpu_setting=gpu_env,
+                   compute_mode=self.cfg.compute_mode,
+                   enable_gpu_setting=self.cfg.enable_gpu_setting,
                    device_type=self.device_type,
-                   cuda_available=torch.cuda.is_available(),
-                   single_task_mode=self.single_task_mode)
+                   cuda_available=self._cuda_available,
+                   single_task_mode=self.cfg.single_task_mode)
         
         # 初始化组件
-        self.processor = MinerUProcessor(enable_gpu=self.enable_gpu)
+        self.processor = MinerUProcessor(enable_gpu=self.cfg.enable_gpu)
+        if self.cfg.enable_gpu is not False:
+            self.processor.warmup()
         self.queue_manager = SQSQueueManager()
         self.job_manager = DynamoDBJobManager()
         self.health_checker = HealthChecker()
         
+        # DynamoDB调用出错时让健康检查重新探测表状态
+        self.job_manager.on_client_error = self.health_checker.invalidate_dynamodb_status
+        
         # Flask应用 (健康检查和指标)
         self.app = Flask(__name__)
         self.setup_flask_routes()
@@ -109,10 +188,10 @@ class MinerUHybridProcessor:
         signal.signal(signal.SIGINT, self.signal_handler)
         
         logger.info("MinerU处理器初始化完成", 
-                   compute_mode=self.compute_mode,
-                   single_task_mode=self.single_task_mode,
-                   enable_gpu=self.enable_gpu,
-                   job_id=self.job_id)
+                   compute_mode=self.cfg.compute_mode,
+                   single_task_mode=self.cfg.single_task_mode,
+                   enable_gpu=self.cfg.enable_gpu,
+                   job_id=self.cfg.job_id)
     
     def setup_flask_routes(self):
         """设置Flask路由"""
@@ -123,10 +202,10 @@ class MinerUHybridProcessor:
             health_status = self.health_checker.check_health()
             # 添加设备类型信息
             health_status['device_type'] = self.device_type
-            health_status['gpu_available'] = torch.cuda.is_available()
-            if torch.cuda.is_available():
-                health_status['gpu_count'] = torch.cuda.device_count()
-                health_status['gpu_name'] = torch.cuda.get_device_name(0)
+            health_status['gpu_available'] = self._cuda_available
+            if self._cuda_available:
+                health_status['gpu_count'] = self._cuda_count
+                health_status['gpu_name'] = self._cuda_name
             status_code = 200 if health_status['healthy'] else 503
             return jsonify(health_status), status_code
         
@@ -140,16 +219,18 @@ class MinerUHybridProcessor:
         @self.app.route('/metrics')
         def metrics():
             """Prometheus指标端点"""
-            return generate_latest()
+            # 显式声明文本格式版本，Prometheus无需内容嗅探
+            return generate_latest(METRICS_REGISTRY), 200, {'Content-Type': CONTENT_TYPE_LATEST}
         
         @self.app.route('/status')
         def status():
             """状态信息端点"""
             return jsonify({
-                'compute_mode': self.compute_mode,
-                'single_task_mode': self.single_task_mode,
-                'enable_gpu': self.enable_gpu,
+                'compute_mode': self.cfg.compute_mode,
+                'single_task_mode': self.cfg.single_task_mode,
+                'enable_gpu': self.cfg.enable_gpu,
                 'current_job': self.current_job,
+                'active_jobs': list(self._snapshot_active_jobs()),
                 'running': self.running,
                 'uptime': time.time() - self.start_time
             })
@@ -158,178 +239,362 @@ class MinerUHybridProcessor:
         """信号处理器"""
         logger.info("收到终止信号", signal=signum)
         self.running = False
+        self._stop_event.set()
         
-        # 如果正在处理任务，标记为中断
-        if self.current_job:
+        # 信号处理器在主线程上执行，主线程可能正持有活跃任务锁；
+        # 状态写入交给独立线程 (非守护线程，进程退出前会等待其完成)
+        threading.Thread(target=self._mark_active_jobs_interrupted,
+                         name='mark-interrupted').start()
+    
+    def _mark_active_jobs_interrupted(self):
+        """把正在处理的任务标记为中断"""
+        for job_id in self._snapshot_active_jobs():
+            with self._active_jobs_lock:
+                processing_state = self._processing_states.get(job_id)
+            if processing_state is not None:
+                self._finish_processing_state(processing_state)
             try:
                 self.job_manager.update_job_status(
-                    self.current_job['job_id'],
+                    job_id,
                     'interrupted',
                     error_message='收到终止信号，任务被中断'
                 )
             except Exception as e:
-                logger.error("更新任务状态失败", error=str(e))
+                logger.error("更新任务状态失败", job_id=job_id, error=str(e))
+    
+    @property
+    def current_job(self) -> Optional[Dict[str, Any]]:
+        """当前任务 (并行处理时返回最早开始的任务)"""
+        with self._active_jobs_lock:
+            return next(iter(self._active_jobs.values()), None)
+    
+    def _snapshot_active_jobs(self) -> Dict[str, Dict[str, Any]]:
+        """获取正在处理的任务快照"""
+        with self._active_jobs_lock:
+            return dict(self._active_jobs)
     
     def run_gpu_mode(self):
         """ECS GPU模式 - 持续监听SQS队列，处理所有任务"""
-        logger.info("启动ECS GPU模式")
+        self.log.info("启动ECS GPU模式")
         
-        poll_interval = int(os.getenv('POLL_INTERVAL', '5'))
+        cfg = self.cfg
+        # GPU串行模式每次只接收1条消息：任务耗时可达数分钟，批量预取的消息会在本地排队
+        # 超过可见性超时被其他节点重复处理，也会阻止其他自动扩容的节点领取
+        max_messages = 1
         
-        while self.running:
-            try:
-                # 从SQS接收消息
-                messages = self.queue_manager.receive_messages(max_messages=1)
-                
-                if messages:
-                    for message in messages:
-                        if not self.running:
-                            break
-                        
-                        try:
-                            # 解析任务数据
-                            job_data = json.loads(message['Body'])
-                            
-                            # ECS模式处理所有任务，不进行模式过滤
-                            logger.info("接收到任务", 
-                                      job_id=job_data.get('job_id'),
-                                      device_type=self.device_type)
-                            
-                            # 计算队列等待时间
-                            sent_time = float(message['Attributes']['SentTimestamp']) / 1000
-                            receive_time = time.time()
-                            queue_wait_time = receive_time - sent_time
-                            
-                            # 添加队列等待时间到任务数据
-                            job_data['queue_wait_time'] = queue_wait_time
-                            job_data['received_at'] = receive_time
-                            job_data['processor_device'] = self.device_type
-                            
-                            # 处理任务
-                            self.process_job(job_data)
-                            
-                            # 删除SQS消息
-                            self.queue_manager.delete_message(message)
-                            
-                        except Exception as e:
-                            logger.error("处理任务失败", error=str(e), message=message)
-                            JOBS_PROCESSED.labels(status='failed', device_type=self.device_type).inc()
-                else:
-                    # 更新队列大小指标
-                    try:
-                        queue_attrs = self.queue_manager.get_queue_attributes()
-                        QUEUE_SIZE.set(int(queue_attrs.get('ApproximateNumberOfMessages', 0)))
-                    except Exception as e:
-                        logger.warning("获取队列属性失败", error=str(e))
+        # 队列大小指标由后台线程定期更新，空轮询时不再额外调用SQS
+        threading.Thread(target=self._queue_size_loop, args=(cfg.queue_metrics_interval,),
+                         name='queue-metrics', daemon=True).start()
+        
+        # CPU模式下单个PDF无法用满所有核心，并行处理多个任务
+        parallel = self.device_type == 'cpu' and not cfg.single_task_mode
+        job_executor = None
+        job_slots = None
+        if parallel:
+            job_executor = ThreadPoolExecutor(max_workers=self.cpu_workers,
+                                              thread_name_prefix='cpu-job')
+            # 空闲工作线程数：有线程空闲就接收新消息，不必等整批任务完成
+            job_slots = threading.BoundedSemaphore(self.cpu_workers)
+            self.log.info("CPU并行处理已启用", workers=self.cpu_workers)
+        
+        try:
+            while self.running:
+                try:
+                    if parallel:
+                        self._receive_into_pool(job_executor, job_slots)
+                        continue
                     
-                    # 短暂休眠
-                    time.sleep(poll_interval)
+                    # 自适应轮询接收消息：上一次非空时短轮询立即取下一条，
+                    # 否则长轮询 (队列为空时最多阻塞20秒，无需额外休眠)
+                    messages = self._receive_until_stopped(max_messages)
                     
+                    if messages:
+                        self._process_batch_serial(messages)
+                        
+                except Exception as e:
+                    self.log.error("ECS GPU模式运行错误", error=str(e))
+                    self._stop_event.wait(cfg.poll_interval)
+        finally:
+            if job_executor is not None:
+                job_executor.shutdown(wait=True)
+    
+    def _receive_until_stopped(self, max_messages: int,
+                               wait_time_seconds: Optional[int] = None) -> list:
+        """
+        在后台线程长轮询SQS，收到终止信号时立即返回
+        
+        Args:
+            max_messages: 最大消息数量
+            wait_time_seconds: 长轮询等待时间 (None时由队列管理器自适应选择)
+            
+        Returns:
+            消息列表 (已停止时为空)
+        """
+        future = self._poll_executor.submit(
+            self.queue_manager.receive_messages,
+            max_messages=max_messages,
+            wait_time_seconds=wait_time_seconds
+        )
+        while not self._stop_event.is_set():
+            try:
+                return future.result(timeout=0.5)
+            except FuturesTimeoutError:
+                continue
+        
+        # 已停止：长轮询稍后返回的消息立即释放回队列，供其他节点处理
+        future.add_done_callback(self._release_late_messages)
+        return []
+    
+    def _release_late_messages(self, future: Future):
+        """将停止后才收到的消息可见性置零"""
+        if future.cancelled() or future.exception() is not None:
+            return
+        self._release_messages(future.result())
+    
+    def _release_messages(self, messages: list):
+        """将未处理的消息可见性置零，立即交还队列供其他节点处理"""
+        for message in messages:
+            self.queue_manager.change_message_visibility(message, 0)
+    
+    def _queue_size_loop(self, interval: float):
+        """后台定期更新队列大小指标，与主轮询循环解耦"""
+        while self.running:
+            try:
+                queue_attrs = self.queue_manager.get_queue_attributes()
+                QUEUE_SIZE.set(int(queue_attrs.get('ApproximateNumberOfMessages', 0)))
             except Exception as e:
-                logger.error("ECS GPU模式运行错误", error=str(e))
-                time.sleep(poll_interval)
+                self.log.debug("获取队列属性失败", error=str(e))
+            self._stop_event.wait(interval)
+    
+    def _process_batch_serial(self, messages: list):
+        """逐条处理消息 (GPU模式)，每条完成后在后台删除，与下一次轮询重叠"""
+        for message in messages:
+            if self._handle_one(message):
+                self._io_executor.submit(self.queue_manager.delete_messages, [message])
+    
+    def _receive_into_pool(self, job_executor: ThreadPoolExecutor,
+                           job_slots: threading.BoundedSemaphore):
+        """
+        按空闲工作线程数接收消息并提交到线程池 (CPU模式)
+        
+        Args:
+            job_executor: 任务线程池
+            job_slots: 空闲工作线程信号量
+        """
+        # 至少等到一个空闲线程，再尽量多占用当前空闲的线程 (不超过SQS单次上限)
+        if not job_slots.acquire(timeout=0.5):
+            return
+        free_slots = 1
+        while free_slots < self.cfg.max_messages and job_slots.acquire(blocking=False):
+            free_slots += 1
+        
+        messages = []
+        try:
+            messages = self._receive_until_stopped(free_slots)
+            for message in messages:
+                future = job_executor.submit(self._handle_one, message)
+                future.add_done_callback(
+                    lambda f, message=message: self._on_parallel_job_done(f, message, job_slots)
+                )
+        finally:
+            # 未被消息占用的线程名额归还
+            for _ in range(free_slots - len(messages)):
+                job_slots.release()
+    
+    def _on_parallel_job_done(self, future: Future, message: Dict[str, Any],
+                              job_slots: threading.BoundedSemaphore):
+        """并行任务结束：归还线程名额，完成的消息立即在后台删除"""
+        job_slots.release()
+        if not future.cancelled() and future.exception() is None and future.result():
+            self._io_executor.submit(self.queue_manager.delete_messages, [message])
+    
+    def _handle_one(self, message: Dict[str, Any]) -> bool:
+        """
+        处理单条SQS消息
+        
+        Args:
+            message: SQS消息
+            
+        Returns:
+            任务是否处理完成 (完成后消息可删除)
+        """
+        if not self.running:
+            # 已停止：尚未开始处理的消息立即释放，而不是等到可见性超时
+            self._release_messages([message])
+            return False
+        
+        try:
+            # 解析任务数据
+            job_data = self.queue_manager.parse_body(message)
+            
+            # ECS模式处理所有任务，不进行模式过滤
+            self.log.info("接收到任务",
+                          job_id=job_data.get('job_id'),
+                          message_id=message.get('MessageId'))
+            
+            # 计算队列等待时间 (SentTimestamp为毫秒整数字符串，缺失时记为0)
+            receive_time = time.time()
+            sent_ms = (message.get('Attributes') or {}).get('SentTimestamp')
+            queue_wait_time = receive_time - int(sent_ms) * 0.001 if sent_ms else 0.0
+            
+            # 添加队列等待时间到任务数据
+            job_data['queue_wait_time'] = queue_wait_time
+            job_data['received_at'] = receive_time
+            job_data['processor_device'] = self.device_type
+            
+            # 处理任务
+            self.process_job(job_data)
+            return True
+            
+        except Exception as e:
+            self.log.error("处理任务失败", error=str(e),
+                           message_id=message.get('MessageId'))
+            JOBS_PROCESSED.labels(status='failed', device_type=self.device_type).inc()
+            return False
     
     def run_fargate_mode(self):
         """Fargate模式 - 处理单个任务后退出"""
-        logger.info("启动Fargate模式", job_id=self.job_id)
+        logger.info("启动Fargate模式", job_id=self.cfg.job_id)
         
-        if not self.job_id:
+        if not self.cfg.job_id:
             logger.error("Fargate模式需要JOB_ID环境变量")
             sys.exit(1)
         
         try:
             # 从DynamoDB获取任务详情
-            job_data = self.job_manager.get_job(self.job_id)
+            job_data = self.job_manager.get_job(self.cfg.job_id)
             if not job_data:
-                logger.error("未找到任务", job_id=self.job_id)
+                logger.error("未找到任务", job_id=self.cfg.job_id)
                 sys.exit(1)
             
             # 处理任务
             self.process_job(job_data)
             
-            logger.info("Fargate任务处理完成", job_id=self.job_id)
+            logger.info("Fargate任务处理完成", job_id=self.cfg.job_id)
             
         except Exception as e:
-            logger.error("Fargate模式处理失败", error=str(e), job_id=self.job_id)
+            logger.error("Fargate模式处理失败", error=str(e), job_id=self.cfg.job_id)
             sys.exit(1)
     
     def process_job(self, job_data: Dict[str, Any]):
         """处理单个任务"""
         job_id = job_data['job_id']
-        self.current_job = job_data
-        
-        logger.info("开始处理任务", job_id=job_id, compute_mode=self.compute_mode)
-        ACTIVE_JOBS.inc()
-        
-        start_time = time.time()
+        logger.info("开始处理任务", job_id=job_id, compute_mode=self.cfg.compute_mode)
         
-        try:
-            # 更新任务状态为处理中，包含队列等待时间
-            update_data = {
-                'worker_id': self.get_worker_id(),
-                'started_at': timestamp_to_beijing_str(start_time)
-            }
-            
-            # 如果有队列等待时间信息，添加到更新数据中
-            if 'queue_wait_time' in job_data:
-                update_data['queue_wait_time'] = job_data['queue_wait_time']
-            if 'received_at' in job_data:
-                update_data['received_at'] = timestamp_to_beijing_str(job_data['received_at'])
+        with self._job_scope(job_id, job_data):
+            # 耗时用单调时钟计算，墙上时间只采样一次
+            start_perf = time.perf_counter()
+            start_time = time.time()
             
-            self.job_manager.update_job_status(
-                job_id, 
-                'processing',
-                **update_data
-            )
+            # 任务开始信息，包含队列等待时间 (随处理中状态或终态一起写入)
+            update_data = {}
             
-            # 执行MinerU处理
-            with PROCESSING_TIME.time():
-                result = self.processor.process_pdf(
-                    data_bucket=job_data['data_bucket'],
-                    input_key=job_data['input_key'],
-                    output_prefix=job_data['output_prefix'],
-                    job_id=job_id
+            try:
+                update_data['worker_id'] = self.get_worker_id()
+                update_data['started_at'] = timestamp_to_beijing_str(start_time)
+                
+                # 如果有队列等待时间信息，添加到更新数据中
+                if 'queue_wait_time' in job_data:
+                    update_data['queue_wait_time'] = job_data['queue_wait_time']
+                if 'received_at' in job_data:
+                    # 时间戳由update_job_status统一转换，已是北京时间字符串时原样写入
+                    update_data['received_at'] = job_data['received_at']
+                
+                # 延迟写入处理中状态：短任务在阈值内完成时，与终态合并为一次写入
+                # 登记后由中断流程负责关闭；已收到终止信号时不再写入
+                with self._active_jobs_lock:
+                    processing_state = {'lock': threading.Lock(), 'finished': not self.running}
+                    self._processing_states[job_id] = processing_state
+                processing_timer = threading.Timer(
+                    self.cfg.processing_state_delay,
+                    self._emit_processing_state,
+                    args=(job_id, update_data, processing_state)
                 )
+                processing_timer.daemon = True
+                processing_timer.start()
             
-            processing_time = time.time() - start_time
+                try:
+                    # 执行MinerU处理
+                    with PROCESSING_TIME.time():
+                        result = self.processor.process_pdf(
+                            data_bucket=job_data['data_bucket'],
+                            input_key=job_data['input_key'],
+                            output_prefix=job_data['output_prefix'],
+                            job_id=job_id
+                        )
+                finally:
+                    self._cancel_processing_state(processing_timer, processing_state)
             
-            # 更新任务状态为完成
-            self.job_manager.update_job_status(
-                job_id,
-                'completed',
-                completed_at=timestamp_to_beijing_str(time.time()),
-                processing_time=processing_time,
-                result=result
-            )
+                processing_time = time.perf_counter() - start_perf
             
-            JOBS_PROCESSED.labels(status='completed', device_type=self.device_type).inc()
-            logger.info("任务处理完成", job_id=job_id, duration=processing_time)
+                # 更新任务状态为完成
+                self.job_manager.update_job_status(
+                    job_id,
+                    'completed',
+                    completed_at=timestamp_to_beijing_str(start_time + processing_time),
+                    processing_time=processing_time,
+                    result=result,
+                    **update_data
+                )
             
-        except Exception as e:
-            # 更新任务状态为失败
-            self.job_manager.update_job_status(
-                job_id,
-                'failed',
-                error_message=str(e),
-                failed_at=timestamp_to_beijing_str(time.time())
-            )
+                JOBS_PROCESSED.labels(status='completed', device_type=self.device_type).inc()
+                logger.info("任务处理完成", job_id=job_id, duration=processing_time)
             
-            JOBS_PROCESSED.labels(status='failed', device_type=self.device_type).inc()
-            logger.error("任务处理失败", job_id=job_id, error=str(e))
+            except Exception as e:
+                # 更新任务状态为失败
+                self.job_manager.update_job_status(
+                    job_id,
+                    'failed',
+                    error_message=str(e),
+                    failed_at=timestamp_to_beijing_str(start_time + time.perf_counter() - start_perf),
+                    **update_data
+                )
             
-            if self.single_task_mode:
-                raise
-        
+                JOBS_PROCESSED.labels(status='failed', device_type=self.device_type).inc()
+                logger.error("任务处理失败", job_id=job_id, error=str(e))
+            
+                if self.cfg.single_task_mode:
+                    raise
+    
+    @contextmanager
+    def _job_scope(self, job_id: str, job_data: Dict[str, Any]):
+        """登记活跃任务并更新活跃任务指标，退出时无论成败都成对释放"""
+        with self._active_jobs_lock:
+            self._active_jobs[job_id] = job_data
+            ACTIVE_JOBS.inc()
+        try:
+            yield
         finally:
-            ACTIVE_JOBS.dec()
-            self.current_job = None
+            with self._active_jobs_lock:
+                self._active_jobs.pop(job_id, None)
+                self._processing_states.pop(job_id, None)
+                ACTIVE_JOBS.dec()
+    
+    def _emit_processing_state(self, job_id: str, update_data: Dict[str, Any],
+                               processing_state: Dict[str, Any]):
+        """任务运行超过阈值后写入处理中状态"""
+        with processing_state['lock']:
+            if processing_state['finished']:
+                return
+            self.job_manager.update_job_status(job_id, 'processing', **update_data)
+    
+    def _cancel_processing_state(self, processing_timer: threading.Timer,
+                                 processing_state: Dict[str, Any]):
+        """取消尚未写入的处理中状态，保证其不会晚于终态写入"""
+        processing_timer.cancel()
+        self._finish_processing_state(processing_state)
+    
+    def _finish_processing_state(self, processing_state: Dict[str, Any]):
+        """标记处理中状态不再写入 (等待进行中的写入结束后返回)"""
+        with processing_state['lock']:
+            processing_state['finished'] = True
     
     def get_worker_id(self) -> str:
         """获取工作节点ID"""
-        hostname = os.getenv('HOSTNAME', 'unknown')
-        if self.compute_mode == 'fargate':
+        hostname = self.cfg.hostname
+        if self.cfg.compute_mode == 'fargate':
             return f"fargate-{hostname}"
-        elif self.compute_mode == 'gpu':
+        elif self.cfg.compute_mode == 'gpu':
             return f"gpu-{hostname}"
         else:
             return f"worker-{hostname}"
@@ -337,7 +602,11 @@ class MinerUHybridProcessor:
     def start_flask_server(self):
         """启动Flask服务器"""
         def run_server():
-            self.app.run(host='0.0.0.0', port=8080, debug=False, use_reloader=False)
+            # 生产级WSGI服务器，使用独立线程池处理健康检查和指标抓取
+            # create_server返回时端口已绑定，此时即可接受健康检查
+            server = create_server(self.app, host='0.0.0.0', port=8080, threads=4)
+            self._flask_ready.set()
+            server.run()
         
         flask_thread = threading.Thread(target=run_server, daemon=True)
         flask_thread.start()
@@ -350,11 +619,12 @@ class MinerUHybridProcessor:
         # 启动Flask服务器
         self.start_flask_server()
         
-        # 等待服务就绪
-        time.sleep(2)
+        # 等待服务就绪 (端口绑定后立即继续，绑定失败时最多等待5秒)
+        if not self._flask_ready.wait(timeout=5):
+            logger.warning("Flask服务器未在超时时间内就绪")
         
         try:
-            if self.single_task_mode:
+            if self.cfg.single_task_mode:
                 # Fargate模式
                 self.run_fargate_mode()
             else:
@@ -367,6 +637,10 @@ class MinerUHybridProcessor:
             logger.error("运行时错误", error=str(e))
             raise
         finally:
+            # 等待后台AWS调用完成，避免已完成任务的消息未被删除
+            self._io_executor.shutdown(wait=True)
+            self._poll_executor.shutdown(wait=False)
+            self.processor.close()
             logger.info("MinerU处理器停止")
 
 def main():
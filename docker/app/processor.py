@@ -3,35 +3,82 @@
 MinerU PDF处理器 - 支持GPU/CPU自动检测
 """
 
+import hashlib
 import os
+import re
+
+# 在导入torch之前配置CUDA缓存分配器 (作为独立模块导入时同样生效)
+os.environ.setdefault('PYTORCH_CUDA_ALLOC_CONF', 'expandable_segments:True')
+
 import shutil
 import sys
+import threading
 import time
-from typing import Dict, Any, Optional
+from types import MappingProxyType
+from typing import Dict, Any, List, Optional, Tuple
 from pathlib import Path
 from decimal import Decimal
 
-import boto3
 import structlog
 import torch
+from boto3.s3.transfer import TransferConfig, create_transfer_manager
+from s3transfer.subscribers import BaseSubscriber
+
+from aws_clients import S3
 from job_manager import timestamp_to_beijing_str
 
 logger = structlog.get_logger()
 
+# 结果文件扩展名对应的Content-Type (只读，模块加载时构建一次)
+_CONTENT_TYPES = MappingProxyType({
+    '.md': 'text/markdown',
+    '.json': 'application/json',
+    '.html': 'text/html',
+    '.txt': 'text/plain',
+    '.png': 'image/png',
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.pdf': 'application/pdf',
+    '.xml': 'application/xml'
+})
+
+# 上传完成汇总日志中列出的文件数
+_UPLOAD_LOG_TAIL = 20
+
+# PDF页面对象标记 (/Type /Page，排除 /Type /Pages 页面树节点)
+_PAGE_OBJECT_RE = re.compile(rb'/Type\s*/Page(?![A-Za-z])')
+
+class _ProvideSizeSubscriber(BaseSubscriber):
+    """提交上传时提供已知的文件大小，传输管理器无需再次stat文件"""
+    
+    def __init__(self, size: int):
+        self._size = size
+    
+    def on_queued(self, future, **kwargs):
+        future.meta.provide_transfer_size(self._size)
+
 class MinerUProcessor:
     """MinerU PDF处理器 - 支持GPU/CPU自动检测"""
     
     def __init__(self, enable_gpu: Optional[bool] = None):
         # 默认启用GPU模式（信任容器环境）
         self.enable_gpu = True
-        logger.info("MinerU处理器启动（GPU模式）")
+        
+        # 详细环境日志 (环境变量和PyTorch/CUDA状态)，默认关闭以减少启动开销和日志量
+        self.log_verbose_env = os.getenv('LOG_VERBOSE_ENV', 'false').lower() == 'true'
         
         # 文件清理配置 - 从环境变量读取
         self.cleanup_files = os.getenv('CLEANUP_FILES', 'true').lower() == 'true'
-        logger.info("文件清理配置", cleanup_enabled=self.cleanup_files)
         
         # 从环境变量读取GPU设置
         self.gpu_memory = int(os.getenv('MINERU_VIRTUAL_VRAM_SIZE', '12000'))
+        # 启动时预先向缓存分配器申请显存池 (默认关闭，vLLM后端自行管理显存)
+        self.preallocate_gpu_pool = os.getenv('MINERU_PREALLOCATE_GPU_POOL', 'false').lower() == 'true'
+        
+        # 进程内不变的诊断信息只检查一次
+        self._mineru_verified = False
+        # GPU设备属性不可变，初始化时查询一次
+        self._gpu_props = self._query_gpu_props()
         
         # 处理参数
         self.language = os.getenv('MINERU_LANGUAGE', 'ch')
@@ -39,23 +86,56 @@ class MinerUProcessor:
         self.parse_method = os.getenv('MINERU_PARSE_METHOD', 'auto')
         self.formula_enable = os.getenv('MINERU_VLM_FORMULA_ENABLE', 'true').lower() == 'true'
         self.table_enable = os.getenv('MINERU_VLM_TABLE_ENABLE', 'true').lower() == 'true'
+        # 每个任务后是否重置vLLM引擎 (关闭后模型常驻显存，后续任务免去重新加载)
+        self.reset_engine_per_job = os.getenv('MINERU_RESET_ENGINE_PER_JOB', 'true').lower() == 'true'
         
         # 工作目录
         self.work_dir = Path(os.getenv('MINERU_WORKSPACE', '/tmp/mineru-workspace'))
         self.work_dir.mkdir(parents=True, exist_ok=True)
         
-        # AWS客户端
-        self.s3_client = boto3.client('s3')
+        # 输入文件本地缓存 (按S3 ETag区分版本)，重试的消息无需重新下载；设为0关闭
+        # 任务目录保留时其硬链接仍占用磁盘，容量上限失效，因此仅在清理文件时启用
+        self.input_cache_max_bytes = (
+            int(os.getenv('INPUT_CACHE_MAX_MB', '2048')) * 1024 * 1024 if self.cleanup_files else 0
+        )
+        self.input_cache_dir = self.work_dir / '_cache'
+        if self.input_cache_max_bytes > 0:
+            self.input_cache_dir.mkdir(exist_ok=True)
+        
+        # AWS客户端 (共享客户端的连接池足够支撑并行传输)
+        self.s3_client = S3
+        
+        # 大文件分段并行传输 (16MB分段)，避免单连接TCP慢启动成为瓶颈
+        self._transfer_config = TransferConfig(
+            multipart_threshold=16 * 1024 * 1024,
+            multipart_chunksize=16 * 1024 * 1024,
+            max_concurrency=32,
+            use_threads=True
+        )
+        
+        # 进程内共享的传输管理器：所有下载和上传复用同一组线程池，
+        # 多个结果文件的上传请求在其中并发执行 (总并发受max_concurrency限制)
+        self._s3_transfer = create_transfer_manager(self.s3_client, self._transfer_config)
+        
+        # 正在执行do_parse的任务数 (CPU模式下可能并行)，最后一个任务结束时才清理引擎单例
+        self._active_parses = 0
+        self._active_parses_lock = threading.Lock()
         
         # 记录环境设置（不修改）
-        self._log_environment_settings()
+        if self.log_verbose_env:
+            self._log_environment_settings()
+            self.validate_environment()
         
+        # 生产环境只输出这一条就绪日志
         logger.info("MinerU处理器初始化完成（信任容器环境）",
                    enable_gpu=self.enable_gpu,
+                   gpu_available=torch.cuda.is_available(),
+                   cleanup_enabled=self.cleanup_files,
                    gpu_memory=self.gpu_memory,
                    language=self.language,
                    backend=self.backend,
-                   parse_method=self.parse_method)
+                   parse_method=self.parse_method,
+                   reset_engine_per_job=self.reset_engine_per_job)
     
     def _log_environment_settings(self):
         """记录当前环境设置（不修改）"""
@@ -89,8 +169,64 @@ class MinerUProcessor:
         except Exception as e:
             logger.warning("环境状态记录失败，但继续执行", error=str(e))
     
+    def warmup(self):
+        """预热CUDA上下文和cuBLAS，避免首个任务承担冷启动开销"""
+        if not torch.cuda.is_available():
+            logger.info("CUDA不可用，跳过GPU预热")
+            return
+        
+        try:
+            warmup_start = time.time()
+            torch.cuda.synchronize()
+            
+            # 分配小张量并执行一次矩阵乘法，初始化CUDA上下文和cuBLAS句柄
+            dummy = torch.empty(64, 64, device='cuda')
+            torch.matmul(dummy, dummy)
+            torch.cuda.synchronize()
+            del dummy
+            
+            # 释放预热产生的缓存，使分配器从干净状态开始
+            torch.cuda.empty_cache()
+            
+            if self.preallocate_gpu_pool:
+                self._preallocate_gpu_pool()
+            
+            logger.info("GPU预热完成", warmup_time=time.time() - warmup_start)
+        except Exception as e:
+            logger.warning("GPU预热失败（非致命）", error=str(e))
+    
+    def _preallocate_gpu_pool(self):
+        """
+        预先分配MINERU_VIRTUAL_VRAM_SIZE大小的显存并交还给缓存分配器，
+        后续张量分配直接复用缓存块，避免推理过程中同步的cudaMalloc
+        
+        注意：empty_cache会把显存池归还驱动，因此需配合
+        MINERU_RESET_ENGINE_PER_JOB=false 使用才能跨任务保留
+        """
+        try:
+            free_bytes, _ = torch.cuda.mem_get_info()
+            pool_bytes = min(self.gpu_memory * 1024 * 1024, int(free_bytes * 0.9))
+            # 释放张量但不调用empty_cache，显存保留在缓存分配器中
+            block = torch.empty(pool_bytes, dtype=torch.uint8, device='cuda')
+            del block
+            logger.info("GPU显存池预分配完成",
+                       pool_mb=pool_bytes // (1024 * 1024),
+                       reserved_mb=torch.cuda.memory_reserved() // (1024 * 1024))
+        except Exception as e:
+            logger.warning("GPU显存池预分配失败（非致命）", error=str(e))
+    
+    def close(self):
+        """关闭共享的S3传输管理器 (等待进行中的传输完成)"""
+        self._s3_transfer.shutdown()
+    
     def _estimate_page_count(self, pdf_bytes: bytes) -> int:
         """估算PDF页数"""
+        # 直接扫描页面对象标记，无需完整解析文档
+        page_count = sum(1 for _ in _PAGE_OBJECT_RE.finditer(pdf_bytes))
+        if page_count:
+            return page_count
+        
+        # 页面对象位于压缩对象流中 (或文档已加密) 时扫描不到，回退到完整解析
         try:
             import pypdfium2 as pdfium
             pdf = pdfium.PdfDocument(pdf_bytes)
@@ -142,12 +278,23 @@ class MinerUProcessor:
                        local_path=str(input_file))
             
             download_start = time.time()
-            self.s3_client.download_file(data_bucket, input_key, str(input_file))
+            cache_path = self._get_input_cache_path(data_bucket, input_key)
+            cache_hit = cache_path is not None and self._link_cached_input(cache_path, input_file)
+            if cache_hit:
+                self._prepare_mineru()
+            else:
+                download_future = self._s3_transfer.download(data_bucket, input_key, str(input_file))
+                # 下载期间预加载MinerU模块，首个任务的导入耗时被下载时间掩盖
+                self._prepare_mineru()
+                download_future.result()
+                if cache_path is not None:
+                    self._store_cached_input(input_file, cache_path)
             download_time = time.time() - download_start
             
             # 验证文件大小
             file_size = input_file.stat().st_size
             logger.info("文件下载完成", 
+                       cache_hit=cache_hit,
                        file_size=file_size,
                        file_size_mb=file_size / (1024*1024),
                        download_time=download_time)
@@ -159,7 +306,7 @@ class MinerUProcessor:
             logger.info("开始MinerU处理", compute_mode='gpu' if self.enable_gpu else 'cpu')
             processing_start = time.time()
             
-            result = self._run_mineru_cli(input_file, output_dir)
+            result = self._run_mineru_cli(input_file, output_dir, file_size)
             
             processing_time = time.time() - processing_start
             logger.info("MinerU处理完成", processing_time=processing_time)
@@ -168,7 +315,7 @@ class MinerUProcessor:
             logger.info("开始上传结果到S3")
             upload_start = time.time()
             
-            output_files = self._upload_results(output_dir, data_bucket, output_prefix)
+            output_files = self._upload_results(output_dir, result['files'], data_bucket, output_prefix)
             
             upload_time = time.time() - upload_start
             logger.info("结果上传完成", 
@@ -222,13 +369,98 @@ class MinerUProcessor:
             
             raise
     
-    def _run_mineru_cli(self, input_file: Path, output_dir: Path) -> Dict[str, Any]:
+    def _get_input_cache_path(self, data_bucket: str, input_key: str) -> Optional[Path]:
+        """
+        获取输入文件的缓存路径 (由存储桶、键和ETag确定，对象被覆盖后自动失效)
+        
+        Args:
+            data_bucket: 统一数据S3存储桶
+            input_key: 输入文件键
+            
+        Returns:
+            缓存路径，缓存关闭或无法获取ETag时返回None
+        """
+        if self.input_cache_max_bytes <= 0:
+            return None
+        try:
+            head = self.s3_client.head_object(Bucket=data_bucket, Key=input_key)
+        except Exception as e:
+            logger.warning("获取输入文件ETag失败，跳过缓存", error=str(e))
+            return None
+        etag = head.get('ETag', '').strip('"')
+        if not etag:
+            return None
+        digest = hashlib.sha256(f"{data_bucket}/{input_key}/{etag}".encode()).hexdigest()
+        return self.input_cache_dir / digest
+    
+    def _link_cached_input(self, cache_path: Path, input_file: Path) -> bool:
+        """缓存命中时把缓存文件硬链接到任务输入目录 (替换上次处理残留的同名文件)"""
+        try:
+            input_file.unlink(missing_ok=True)
+            os.link(cache_path, input_file)
+        except OSError:
+            return False
+        # 更新修改时间，淘汰时按最近使用排序
+        try:
+            os.utime(cache_path)
+        except OSError:
+            pass
+        return True
+    
+    def _store_cached_input(self, input_file: Path, cache_path: Path):
+        """把下载的输入文件硬链接进缓存，并淘汰超出容量的最旧文件"""
+        try:
+            os.link(input_file, cache_path)
+        except FileExistsError:
+            pass
+        except OSError as e:
+            logger.warning("写入输入文件缓存失败", error=str(e))
+            return
+        self._evict_input_cache()
+    
+    def _evict_input_cache(self):
+        """按修改时间从旧到新删除缓存文件，直到总大小不超过上限"""
+        entries = []
+        total_size = 0
+        with os.scandir(self.input_cache_dir) as it:
+            for entry in it:
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total_size += stat.st_size
+        
+        if total_size <= self.input_cache_max_bytes:
+            return
+        
+        entries.sort()
+        for _, size, path in entries:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+            if total_size <= self.input_cache_max_bytes:
+                break
+    
+    def _prepare_mineru(self):
+        """预加载MinerU Python API模块 (仅首次导入有实际开销，失败时留给处理阶段报错)"""
+        try:
+            import mineru.cli.common  # noqa: F401
+            if self.enable_gpu:
+                import mineru.backend.vlm.vlm_analyze  # noqa: F401
+        except Exception as e:
+            logger.warning("MinerU模块预加载失败", error=str(e))
+    
+    def _run_mineru_cli(self, input_file: Path, output_dir: Path, file_size: int) -> Dict[str, Any]:
         """
         使用MinerU Python API直接处理PDF（不走CLI/HTTP，避免超时问题）
         
         Args:
             input_file: 输入PDF文件路径
             output_dir: 输出目录路径
+            file_size: 输入文件大小 (下载后已校验)
             
         Returns:
             处理结果
@@ -236,19 +468,7 @@ class MinerUProcessor:
         start_time = time.time()
         
         # 诊断处理环境
-        self._diagnose_processing_environment(input_file, output_dir)
-        
-        # GPU状态记录
-        if self.enable_gpu:
-            try:
-                logger.info("GPU状态查看", 
-                           cuda_available=torch.cuda.is_available(),
-                           device_count=torch.cuda.device_count(),
-                           current_device=torch.cuda.current_device() if torch.cuda.is_available() else None)
-                if torch.cuda.is_available():
-                    logger.info("GPU设备信息", device_name=torch.cuda.get_device_name(0))
-            except Exception as e:
-                logger.warning("GPU状态查看失败", error=str(e))
+        self._diagnose_processing_environment(input_file, output_dir, file_size)
         
         # 使用MinerU Python API直接调用
         from mineru.cli.common import do_parse, read_fn
@@ -263,93 +483,113 @@ class MinerUProcessor:
                    language=self.language,
                    file_name=pdf_file_name)
         
-        # 直接调用do_parse — 同步执行，无HTTP超时问题
-        # hybrid-auto-engine 会自动选择 vllm-engine（同步模式）
-        do_parse(
-            output_dir=str(output_dir),
-            pdf_file_names=[pdf_file_name],
-            pdf_bytes_list=[pdf_bytes],
-            p_lang_list=[self.language],
-            backend=self.backend,
-            parse_method=self.parse_method,
-            formula_enable=self.formula_enable,
-            table_enable=self.table_enable,
-            f_dump_md=True,
-            f_dump_middle_json=False,
-            f_dump_model_output=False,
-            f_dump_orig_pdf=False,
-            f_dump_content_list=False,
-        )
+        with self._active_parses_lock:
+            self._active_parses += 1
         
-        # 清理 vLLM 引擎单例，避免 EngineCore 子进程在后续任务中崩溃
-        # vLLM v0.11.x 的 EngineCore 使用 multiprocessing spawn，
-        # 长驻容器中引擎空闲后子进程可能进入不稳定状态
         try:
-            from mineru.backend.vlm.vlm_analyze import ModelSingleton
-            singleton = ModelSingleton()
-            with singleton._lock:
-                for key, predictor in list(singleton._models.items()):
-                    try:
-                        if hasattr(predictor, 'llm') and predictor.llm is not None:
-                            del predictor.llm
-                        if hasattr(predictor, 'close'):
-                            predictor.close()
-                    except Exception:
-                        pass
-                singleton._models.clear()
-            torch.cuda.empty_cache()
-            logger.info("vLLM引擎单例已清理，下次任务将重新初始化")
-        except Exception as e:
-            logger.warning("vLLM引擎清理失败（非致命）", error=str(e))
+            # 直接调用do_parse — 同步执行，无HTTP超时问题
+            # hybrid-auto-engine 会自动选择 vllm-engine（同步模式）
+            do_parse(
+                output_dir=str(output_dir),
+                pdf_file_names=[pdf_file_name],
+                pdf_bytes_list=[pdf_bytes],
+                p_lang_list=[self.language],
+                backend=self.backend,
+                parse_method=self.parse_method,
+                formula_enable=self.formula_enable,
+                table_enable=self.table_enable,
+                f_dump_md=True,
+                f_dump_middle_json=False,
+                f_dump_model_output=False,
+                f_dump_orig_pdf=False,
+                f_dump_content_list=False,
+            )
+        finally:
+            # 清理 vLLM 引擎单例，避免 EngineCore 子进程在后续任务中崩溃
+            # vLLM v0.11.x 的 EngineCore 使用 multiprocessing spawn，
+            # 长驻容器中引擎空闲后子进程可能进入不稳定状态
+            # 仍有并行任务在使用引擎时跳过清理，由最后一个任务负责；
+            # 清理在锁内完成，新任务须等待清理结束才能开始解析
+            # MINERU_RESET_ENGINE_PER_JOB=false 时保留引擎，模型加载开销由所有任务分摊
+            with self._active_parses_lock:
+                self._active_parses -= 1
+                if self._active_parses == 0 and self.reset_engine_per_job:
+                    self._release_vllm_engine()
         
         processing_time = time.time() - start_time
         
-        # 验证输出文件
-        output_files = list(output_dir.rglob('*'))
-        output_files = [f for f in output_files if f.is_file()]
+        # 验证输出文件 (只遍历一次输出目录，文件列表供上传复用)
+        output_files = self._collect_output_files(output_dir)
         
         logger.info("MinerU处理完成", 
                    processing_time=processing_time,
                    output_files_count=len(output_files),
-                   output_files=[f.name for f in output_files[:10]])
+                   output_files=[f.name for f, _ in output_files[:10]])
         
         if not output_files:
             raise RuntimeError("MinerU处理未生成任何输出文件")
         
         return {
-            'pages': self._count_output_pages(output_dir),
+            'pages': self._estimate_page_count(pdf_bytes),
             'processing_time': processing_time,
             'output_files_count': len(output_files),
+            'files': output_files,
             'success': True,
             'compute_mode': 'gpu' if self.enable_gpu else 'cpu',
         }
     
-    def _count_output_pages(self, output_dir: Path) -> int:
-        """从输出目录推断处理的页数"""
+    def _release_vllm_engine(self):
+        """清理vLLM引擎单例，下次任务重新初始化"""
         try:
-            md_files = list(output_dir.rglob('*.md'))
-            if md_files:
-                return len(md_files)
-            return 1
-        except Exception:
-            return 0
+            from mineru.backend.vlm.vlm_analyze import ModelSingleton
+            singleton = ModelSingleton()
+            with singleton._lock:
+                for key, predictor in list(singleton._models.items()):
+                    try:
+                        if hasattr(predictor, 'llm') and predictor.llm is not None:
+                            del predictor.llm
+                        if hasattr(predictor, 'close'):
+                            predictor.close()
+                    except Exception:
+                        pass
+                singleton._models.clear()
+            torch.cuda.empty_cache()
+            logger.info("vLLM引擎单例已清理，下次任务将重新初始化")
+        except Exception as e:
+            logger.warning("vLLM引擎清理失败（非致命）", error=str(e))
     
-    def _diagnose_processing_environment(self, input_file: Path, output_dir: Path):
+    def _collect_output_files(self, output_dir: Path) -> List[Tuple[Path, int]]:
+        """
+        递归收集输出目录中的文件
+        
+        Args:
+            output_dir: 输出目录
+            
+        Returns:
+            (文件路径, 文件大小) 列表
+        """
+        files = []
+        pending = [str(output_dir)]
+        while pending:
+            with os.scandir(pending.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+                    elif entry.is_file():
+                        files.append((Path(entry.path), entry.stat().st_size))
+        return files
+    
+    def _diagnose_processing_environment(self, input_file: Path, output_dir: Path, file_size: int):
         """诊断处理环境"""
         logger.info("=== 处理环境诊断 ===")
         
-        # 检查输入文件
-        if input_file.exists():
-            file_size = input_file.stat().st_size
-            logger.info("输入文件信息", 
-                       file=str(input_file),
-                       exists=True,
-                       size=file_size,
-                       size_mb=file_size / (1024*1024),
-                       readable=os.access(input_file, os.R_OK))
-        else:
-            logger.error("输入文件不存在", file=str(input_file))
-            raise FileNotFoundError(f"输入文件不存在: {input_file}")
+        # 检查输入文件 (存在性和大小已在下载后通过stat确认，无需再次stat)
+        logger.info("输入文件信息", 
+                   file=str(input_file),
+                   exists=True,
+                   size=file_size,
+                   size_mb=file_size / (1024*1024),
+                   readable=os.access(input_file, os.R_OK))
         
         # 检查输出目录
         logger.info("输出目录信息",
@@ -368,42 +608,56 @@ class MinerUProcessor:
         if free < 1024**3:  # 少于1GB
             logger.warning("磁盘空间不足", free_gb=free // (1024**3))
         
-        # 检查GPU状态
+        # 检查GPU状态 (使用初始化时缓存的设备属性，实时显存统计仅在详细模式下查询)
         if self.enable_gpu:
             try:
-                import torch
                 logger.info("GPU状态检查",
-                           cuda_available=torch.cuda.is_available(),
-                           device_count=torch.cuda.device_count(),
-                           current_device=torch.cuda.current_device() if torch.cuda.is_available() else None)
+                           cuda_available=bool(self._gpu_props),
+                           device_count=len(self._gpu_props),
+                           devices=[{'name': props['name'],
+                                     'memory_total_gb': props['total_memory'] // (1024**3)}
+                                    for props in self._gpu_props])
                 
-                if torch.cuda.is_available():
-                    for i in range(torch.cuda.device_count()):
-                        props = torch.cuda.get_device_properties(i)
-                        memory_allocated = torch.cuda.memory_allocated(i)
-                        memory_reserved = torch.cuda.memory_reserved(i)
-                        logger.info(f"GPU {i} 详情",
-                                   name=props.name,
-                                   memory_total_gb=props.total_memory // (1024**3),
-                                   memory_allocated_mb=memory_allocated // (1024**2),
-                                   memory_reserved_mb=memory_reserved // (1024**2))
+                if self.log_verbose_env:
+                    for i in range(len(self._gpu_props)):
+                        logger.info(f"GPU {i} 显存",
+                                   memory_allocated_mb=torch.cuda.memory_allocated(i) // (1024**2),
+                                   memory_reserved_mb=torch.cuda.memory_reserved(i) // (1024**2))
             except Exception as e:
                 logger.error("GPU状态检查失败", error=str(e))
         
-        # 测试MinerU Python API可用性
+        # 测试MinerU Python API可用性 (成功一次后不再重复)
+        if not self._mineru_verified:
+            try:
+                from mineru.cli.common import do_parse
+                logger.info("MinerU Python API验证成功")
+            except ImportError as e:
+                logger.error("MinerU Python API不可用", error=str(e))
+                raise RuntimeError(f"MinerU Python API导入失败: {e}")
+            self._mineru_verified = True
+    
+    def _query_gpu_props(self) -> list:
+        """查询所有GPU的设备属性 (CUDA不可用或查询失败时为空)"""
         try:
-            from mineru.cli.common import do_parse
-            logger.info("MinerU Python API验证成功")
-        except ImportError as e:
-            logger.error("MinerU Python API不可用", error=str(e))
-            raise RuntimeError(f"MinerU Python API导入失败: {e}")
+            if not torch.cuda.is_available():
+                return []
+            return [
+                {'name': props.name, 'total_memory': props.total_memory}
+                for props in map(torch.cuda.get_device_properties,
+                                 range(torch.cuda.device_count()))
+            ]
+        except Exception as e:
+            logger.warning("无法获取GPU设备属性", error=str(e))
+            return []
 
-    def _upload_results(self, output_dir: Path, data_bucket: str, output_prefix: str) -> list:
+    def _upload_results(self, output_dir: Path, files: List[Tuple[Path, int]],
+                        data_bucket: str, output_prefix: str) -> list:
         """
         上传处理结果到S3
         
         Args:
             output_dir: 输出目录
+            files: 待上传的 (文件路径, 文件大小) 列表
             data_bucket: 统一数据S3存储桶
             output_prefix: 输出前缀 (output/{job_id}/)
             
@@ -417,86 +671,90 @@ class MinerUProcessor:
         
         uploaded_files = []
         
-        # 首先检查输出目录是否存在文件
-        all_files = list(output_dir.rglob('*'))
-        file_list = [f for f in all_files if f.is_file()]
-        
-        logger.info("输出目录文件统计",
-                   total_items=len(all_files),
-                   files_count=len(file_list),
-                   directories_count=len(all_files) - len(file_list))
+        logger.info("输出目录文件统计", files_count=len(files))
         
-        if not file_list:
+        if not files:
             logger.warning("输出目录中没有文件可上传")
-            # 列出所有项目进行调试
-            for item in all_files:
-                logger.info("目录项", path=str(item), is_file=item.is_file(), is_dir=item.is_dir())
             return uploaded_files
         
-        # 遍历输出目录中的所有文件
-        for file_path in file_list:
-            # 计算相对路径
-            relative_path = file_path.relative_to(output_dir)
-            s3_key = f"{output_prefix}{relative_path}"
-            
+        # 所有文件一次性提交给传输管理器并行上传，结果按原文件顺序返回
+        job_id = output_prefix.strip('/').split('/')[-1]  # 从prefix提取job_id
+        transfers = [
+            self._submit_upload(file_path, file_size, output_dir, data_bucket, output_prefix, job_id)
+            for file_path, file_size in files
+        ]
+        for future, file_info in transfers:
             try:
-                file_size = file_path.stat().st_size
-                logger.info("准备上传文件", 
-                           local_file=str(file_path),
-                           s3_key=s3_key,
-                           size_bytes=file_size)
-                
-                # 上传到S3
-                self.s3_client.upload_file(
-                    str(file_path),
-                    data_bucket,
-                    s3_key,
-                    ExtraArgs={
-                        'Metadata': {
-                            'job-id': output_prefix.strip('/').split('/')[-1],  # 从prefix提取job_id
-                            'original-name': file_path.name.encode('ascii', 'ignore').decode('ascii'),  # 处理中文字符
-                            'content-type': self._get_content_type(file_path)
-                        }
-                    }
-                )
-                
-                s3_url = f"s3://{data_bucket}/{s3_key}"
-                uploaded_files.append({
-                    'file_name': file_path.name,
-                    'file_type': file_path.suffix,
-                    's3_url': s3_url,
-                    'size': file_size
-                })
-                
-                logger.info("文件上传成功", 
-                           file=s3_url,
-                           size_mb=file_size / (1024*1024))
-                
+                future.result()
             except Exception as e:
                 logger.error("文件上传失败", 
-                           file=str(file_path), 
-                           s3_key=s3_key,
+                           file=file_info['s3_url'],
                            error=str(e))
+                # 任一文件失败时取消其余上传，保持原有的失败语义
+                for pending, _ in transfers:
+                    pending.cancel()
                 raise
+            logger.debug("文件上传成功", 
+                       file=file_info['s3_url'],
+                       size_mb=file_info['size'] / (1024*1024))
+            uploaded_files.append(file_info)
         
+        # 逐文件日志为debug级别，此处汇总输出一条 (附最后若干个文件便于排查)
         logger.info("所有文件上传完成", 
                    uploaded_count=len(uploaded_files),
-                   total_size_mb=sum(f['size'] for f in uploaded_files) / (1024*1024))
+                   total_size_mb=sum(f['size'] for f in uploaded_files) / (1024*1024),
+                   last_files=[f['s3_url'] for f in uploaded_files[-_UPLOAD_LOG_TAIL:]])
         
         return uploaded_files
     
+    def _submit_upload(self, file_path: Path, file_size: int, output_dir: Path, data_bucket: str,
+                       output_prefix: str, job_id: str) -> Tuple[Any, Dict[str, Any]]:
+        """
+        提交单个结果文件的上传
+        
+        Args:
+            file_path: 本地文件路径
+            file_size: 文件大小 (收集输出文件时已获取)
+            output_dir: 输出目录 (用于计算相对路径)
+            data_bucket: 统一数据S3存储桶
+            output_prefix: 输出前缀 (output/{job_id}/)
+            job_id: 任务ID
+            
+        Returns:
+            (传输future, 上传文件信息)
+        """
+        # 计算相对路径
+        relative_path = file_path.relative_to(output_dir)
+        s3_key = f"{output_prefix}{relative_path}"
+        
+        logger.debug("准备上传文件", 
+                   local_file=str(file_path),
+                   s3_key=s3_key,
+                   size_bytes=file_size)
+        
+        # 传入文件名而非文件对象，由传输管理器在实际上传时才打开文件，避免大量文件同时占用句柄
+        # 文件大小在收集输出文件时已获取，通过订阅器直接提供
+        future = self._s3_transfer.upload(
+            str(file_path),
+            data_bucket,
+            s3_key,
+            extra_args={
+                'Metadata': {
+                    'job-id': job_id,
+                    'original-name': file_path.name.encode('ascii', 'ignore').decode('ascii'),  # 处理中文字符
+                    'content-type': self._get_content_type(file_path)
+                }
+            },
+            subscribers=[_ProvideSizeSubscriber(file_size)]
+        )
+        
+        return future, {
+            'file_name': file_path.name,
+            'file_type': file_path.suffix,
+            's3_url': f"s3://{data_bucket}/{s3_key}",
+            'size': file_size
+        }
+    
     def _get_content_type(self, file_path: Path) -> str:
         """根据文件扩展名获取Content-Type"""
-        suffix = file_path.suffix.lower()
-        content_types = {
-            '.md': 'text/markdown',
-            '.json': 'application/json',
-            '.html': 'text/html',
-            '.txt': 'text/plain',
-            '.png': 'image/png',
-            '.jpg': 'image/jpeg',
-            '.jpeg': 'image/jpeg',
-            '.pdf': 'application/pdf',
-            '.xml': 'application/xml'
-        }
-        return content_types.get(suffix, 'application/octet-stream')
+        return _CONTENT_TYPES.get(file_path.suffix.lower(), 'application/octet-stream')
@@ -8,36 +8,64 @@ import os
 import json
 from typing import List, Dict, Any, Optional
 
-import boto3
 import structlog
 from botocore.exceptions import ClientError
 
+from aws_clients import SQS
+
+# 优先使用orjson解析和序列化消息体，未安装时回退到标准库
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_json_loads = orjson.loads if orjson else json.loads
+
+def _json_dumps(obj: Any) -> str:
+    """序列化消息体为字符串"""
+    if orjson:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj)
+
 logger = structlog.get_logger()
 
+# SQS批量接口单次最多处理的消息数
+_SQS_BATCH_SIZE = 10
+
+# SQS长轮询最长等待时间(秒)
+_SQS_LONG_POLL_SECONDS = 20
+
 class SQSQueueManager:
     """SQS队列管理器"""
     
     def __init__(self):
-        self.sqs_client = boto3.client('sqs')
+        self.sqs_client = SQS
         self.queue_url = os.getenv('SQS_QUEUE_URL')
         
         if not self.queue_url:
             raise ValueError("SQS_QUEUE_URL环境变量未设置")
         
+        # 上一次接收是否拿到消息，用于自适应选择短轮询/长轮询
+        self._last_nonempty = False
+        
         logger.info("SQS队列管理器初始化", queue_url=self.queue_url)
     
-    def receive_messages(self, max_messages: int = 1, 
-                        wait_time_seconds: int = 20) -> List[Dict[str, Any]]:
+    def receive_messages(self, max_messages: int = _SQS_BATCH_SIZE, 
+                        wait_time_seconds: Optional[int] = None) -> List[Dict[str, Any]]:
         """
         从SQS队列接收消息
         
         Args:
             max_messages: 最大消息数量
-            wait_time_seconds: 长轮询等待时间
+            wait_time_seconds: 长轮询等待时间，None时自适应：
+                上次收到消息则短轮询(0秒)立即取下一批，否则长轮询(20秒)
             
         Returns:
             消息列表
         """
+        if wait_time_seconds is None:
+            wait_time_seconds = 0 if self._last_nonempty else _SQS_LONG_POLL_SECONDS
+        
         try:
             response = self.sqs_client.receive_message(
                 QueueUrl=self.queue_url,
@@ -48,22 +76,11 @@ class SQSQueueManager:
             )
             
             messages = response.get('Messages', [])
+            self._last_nonempty = bool(messages)
             
             if messages:
+                # 消息体在真正处理时才通过parse_body解析，接收路径不做JSON解析
                 logger.info("接收到SQS消息", count=len(messages))
-                
-                # 解析消息内容
-                for message in messages:
-                    try:
-                        body = json.loads(message['Body'])
-                        message['ParsedBody'] = body
-                        logger.debug("消息解析成功", 
-                                   message_id=message['MessageId'],
-                                   job_id=body.get('job_id'))
-                    except json.JSONDecodeError as e:
-                        logger.error("消息解析失败", 
-                                   message_id=message['MessageId'],
-                                   error=str(e))
             
             return messages
             
@@ -74,6 +91,31 @@ class SQSQueueManager:
             logger.error("SQS操作异常", error=str(e))
             raise
     
+    def parse_body(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        解析消息体 (首次调用时解析并缓存到ParsedBody)
+        
+        Args:
+            message: SQS消息
+            
+        Returns:
+            解析后的消息内容
+            
+        Raises:
+            ValueError: 消息体不是合法JSON
+        """
+        body = message.get('ParsedBody')
+        if body is None:
+            try:
+                body = _json_loads(message['Body'])
+            except ValueError as e:
+                logger.error("消息解析失败", 
+                           message_id=message.get('MessageId'),
+                           error=str(e))
+                raise
+            message['ParsedBody'] = body
+        return body
+    
     def delete_message(self, message: Dict[str, Any]) -> bool:
         """
         删除SQS消息
@@ -104,6 +146,56 @@ class SQSQueueManager:
             logger.error("删除消息异常", error=str(e))
             return False
     
+    def delete_messages(self, messages: List[Dict[str, Any]]) -> bool:
+        """
+        批量删除SQS消息 (按每批10条分组调用)
+        
+        Args:
+            messages: 要删除的消息列表
+            
+        Returns:
+            是否全部删除成功
+        """
+        success = True
+        for start in range(0, len(messages), _SQS_BATCH_SIZE):
+            if not self._delete_message_batch(messages[start:start + _SQS_BATCH_SIZE]):
+                success = False
+        return success
+    
+    def _delete_message_batch(self, messages: List[Dict[str, Any]]) -> bool:
+        """
+        单次批量删除SQS消息 (最多10条)
+        
+        Args:
+            messages: 要删除的消息列表
+            
+        Returns:
+            是否全部删除成功
+        """
+        try:
+            response = self.sqs_client.delete_message_batch(
+                QueueUrl=self.queue_url,
+                Entries=[
+                    {'Id': str(i), 'ReceiptHandle': message['ReceiptHandle']}
+                    for i, message in enumerate(messages)
+                ]
+            )
+            
+            failed = response.get('Failed', [])
+            if failed:
+                logger.error("部分SQS消息删除失败", failed=failed)
+                return False
+            
+            logger.info("SQS消息批量删除成功", count=len(messages))
+            return True
+            
+        except ClientError as e:
+            logger.error("批量删除SQS消息失败", error=str(e))
+            return False
+        except Exception as e:
+            logger.error("批量删除消息异常", error=str(e))
+            return False
+    
     def change_message_visibility(self, message: Dict[str, Any], 
                                 visibility_timeout: int) -> bool:
         """
@@ -178,7 +270,7 @@ class SQSQueueManager:
         try:
             params = {
                 'QueueUrl': self.queue_url,
-                'MessageBody': json.dumps(message_body),
+                'MessageBody': _json_dumps(message_body),
                 'MessageGroupId': message_group_id
             }
             